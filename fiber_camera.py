@@ -1,12 +1,11 @@
 """Module to process video from camera to obtain the fiber diameter and display it"""
 import time
-import sys
+import threading
 import cv2
 import numpy as np
-from typing import Tuple
-from PyQt5.QtWidgets import QWidget, QLabel, QDoubleSpinBox, QCheckBox, QApplication
-from PyQt5.QtGui import QImage, QPixmap
-from PyQt5.QtCore import QTimer, Qt, QThread, pyqtSignal
+from typing import Optional, Tuple
+from PyQt5.QtWidgets import QWidget, QDoubleSpinBox
+from PyQt5.QtCore import QObject, pyqtSignal
 
 from database import Database
 from typing import TYPE_CHECKING #new check
@@ -16,116 +15,88 @@ if TYPE_CHECKING:
 class FiberCamera(QWidget):
     """Proceess video from camera to obtain the fiber diameter and display it"""
     use_binary_for_edges = True
+    KERNEL = np.ones((5, 5), np.uint8)
+
     def __init__(self, target_diameter: QDoubleSpinBox, gui: 'UserInterface') -> None: #new check
         super().__init__()
-        self.raw_image = QLabel()
-        self.canny_image = QLabel()
-        self.processed_image = QLabel()
         self.target_diameter = target_diameter
         self.capture = cv2.VideoCapture(0)
+        # Keep only the newest frame in the driver so reads are never stale
+        self.capture.set(cv2.CAP_PROP_BUFFERSIZE, 1)
         self.gui = gui  #New check
-        self.line_value_updated = pyqtSignal(float)  # Create a new signal
-        self.diameter_coefficient = Database.get_calibration_data(
-            "diameter_coefficient")
+        self.diameter_coefficient = np.float32(Database.get_calibration_data(
+            "diameter_coefficient"))
         self.previous_time = 0.0
-
-    def camera_loop(self) -> None:
-        """Loop to capture and process frames from the camera"""
+        self.fiber_diameter = 0.0
+        # Plain copy of the GUI controls, kept up to date from their signals
+        # on the GUI thread so processing never touches widgets
+        self.settings = {}
+        # Reused every frame for the middle section of the image
+        width = int(self.capture.get(cv2.CAP_PROP_FRAME_WIDTH))
+        height = int(self.capture.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        self._gray = np.empty((3*height//4 - height//4, width), np.uint8)
+        self._edges = np.empty_like(self._gray)
+
+    def process_frame(self, frame: np.ndarray) -> Tuple[np.ndarray, np.ndarray, float]:
+        """Process a captured frame to get the fiber diameter"""
         current_time=time.time()
-        success, frame = self.capture.read()
-        assert success, "Failed to capture frame"  # Check if frame is captured
-
-        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)  # To RGB for GUI
         height, _, _ = frame.shape
         frame = frame[height//4:3*height//4, :]  # Keep the middle section
         edges, binary_frame = self.get_edges(frame)
         # Get diameter from the binary image
         # TODO: Tune and set to constants for fiber line detection
-        hough_threshold = self.hough_threshold_slider.value()
+        hough_threshold = self.settings["hough_threshold"]
         detected_lines = cv2.HoughLinesP(edges, 1, np.pi / 180, hough_threshold, minLineLength=30, maxLineGap=100)
         fiber_diameter = self.get_fiber_diameter(detected_lines)
+        self.fiber_diameter = fiber_diameter
         # Plot lines on the frame
         frame = self.plot_lines(frame, detected_lines)
-        # Emit the line_value_updated signal with the new line_value
-        #self.line_value_updated.emit(line_value)
         Database.camera_timestamps.append(current_time)
         Database.diameter_readings.append(fiber_diameter)
-        Database.diameter_setpoint.append(self.target_diameter.value())
+        Database.diameter_setpoint.append(self.settings["target_diameter"])
         Database.diameter_delta_time.append(current_time - self.previous_time)
         self.previous_time = current_time
-        
-
-        # Display the frame with lines
-        image_for_gui = QImage(frame, frame.shape[1], frame.shape[0],
-                                QImage.Format_RGB888)
-        self.raw_image.setPixmap(QPixmap(image_for_gui))
-        
-        # Display Canny
-        image_for_gui = QImage(edges, edges.shape[1], edges.shape[0],
-                                QImage.Format_Grayscale8)
-        self.canny_image.setPixmap(QPixmap(image_for_gui))
-
-        # Binary Image
-        image_for_gui = QImage(binary_frame, binary_frame.shape[1],
-                               binary_frame.shape[0], QImage.Format_Grayscale8)
-        self.processed_image.setPixmap(QPixmap(image_for_gui))
+        return frame, binary_frame, fiber_diameter
 
     def get_edges(self, frame: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
-        frame = cv2.cvtColor(frame, cv2.COLOR_RGB2GRAY)
-        kernel = np.ones((5,5), np.uint8)
-        if self.erode_checkbox.isChecked():
-            frame = cv2.erode(frame, kernel, iterations=2)
-        if self.dilate_checkbox.isChecked():
-            frame = cv2.dilate(frame, kernel, iterations=2)
-        if self.blur_checkbox.isChecked():
+        # Buffers are only reused when the frame size matches, OpenCV
+        # allocates new ones otherwise (e.g. full frames during calibration)
+        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=self._gray)
+        if self.settings["erode"]:
+            frame = cv2.erode(frame, self.KERNEL, iterations=2)
+        if self.settings["dilate"]:
+            frame = cv2.dilate(frame, self.KERNEL, iterations=2)
+        if self.settings["blur"]:
             frame = cv2.GaussianBlur(frame, (5, 5), 0)
-        if self.binary_checkbox.isChecked():
+        if self.settings["binary"]:
             _, binary_frame = cv2.threshold(frame, 100, 255, cv2.THRESH_BINARY)
         else:
-            binary_frame = frame.copy()
-        edges = cv2.Canny(binary_frame, 100, 250, apertureSize=3)
-        lower = self.canny_lower_slider.value()
-        higher = self.canny_higher_slider.value()
-        edges = cv2.Canny(binary_frame, lower, higher, apertureSize=3)
+            binary_frame = frame
+        lower = self.settings["canny_lower"]
+        higher = self.settings["canny_higher"]
+        edges = cv2.Canny(binary_frame, lower, higher, edges=self._edges,
+                          apertureSize=3)
         return edges, binary_frame
 
 
+    def update_setting(self, name: str, value) -> None:
+        """Record a new value for one of the processing controls"""
+        self.settings[name] = value
+
     def get_fiber_diameter(self, lines):
         """Get the fiber diameter from the edges detected in the image"""
-        leftmost_min = sys.maxsize
-        leftmost_max = 0
-        rightmost_min = sys.maxsize
-        rightmost_max = 0
-        if lines is None or len(lines) <= 1:
-            return 0
-        for line in lines:
-            x0, _, x1, _ = line[0]
-            # Find if local leftmost is less than the previous leftmost 
-            leftmost_min = min(leftmost_min, x0, x1)
-            leftmost_max = max(leftmost_max, min(x0, x1))
-            rightmost_min = min(rightmost_min, max(x0, x1))
-            rightmost_max = max(rightmost_max, x0, x1)
-
-        return (((leftmost_max - leftmost_min) + (rightmost_max - rightmost_min))
-                / 2 * self.diameter_coefficient )
-    
+        return self.get_fiber_diameter_noC(lines) * self.diameter_coefficient
+
     def get_fiber_diameter_noC(self, lines): #NEW CHECK QUICK FIX
-        """Get the fiber diameter from the edges detected in the image"""
-        leftmost_min = sys.maxsize
-        leftmost_max = 0
-        rightmost_min = sys.maxsize
-        rightmost_max = 0
+        """Get the fiber diameter in pixels from the edges detected in the image"""
         if lines is None or len(lines) <= 1:
             return 0
-        for line in lines:
-            x0, _, x1, _ = line[0]
-            # Find if local leftmost is less than the previous leftmost 
-            leftmost_min = min(leftmost_min, x0, x1)
-            leftmost_max = max(leftmost_max, min(x0, x1))
-            rightmost_min = min(rightmost_min, max(x0, x1))
-            rightmost_max = max(rightmost_max, x0, x1)
-
-        return (((leftmost_max - leftmost_min) + (rightmost_max - rightmost_min))/ 2 )
+        x_coordinates = lines[:, 0, [0, 2]]
+        # Left and right end of every line
+        leftmost = x_coordinates.min(axis=1)
+        rightmost = x_coordinates.max(axis=1)
+        return float(((leftmost.max() - leftmost.min())
+                      + (rightmost.max() - rightmost.min())) / 2)
     
 
     def plot_lines(self, frame, lines):
@@ -133,7 +104,7 @@ class FiberCamera(QWidget):
         if lines is not None:
             for line in lines:
                 x0, y0, x1, y1 = line[0]
-                cv2.line(frame, (x0, y0), (x1, y1), (255, 0, 0), 2)
+                cv2.line(frame, (x0, y0), (x1, y1), (0, 0, 255), 2)
         return frame
 
     def calibrate(self):
@@ -146,7 +117,6 @@ class FiberCamera(QWidget):
         for _ in range(num_samples):
             success, frame = self.capture.read()
             assert success, "Failed to capture frame"  # Check if frame is captured
-            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
             edges, _ = self.get_edges(frame)
             detected_lines = cv2.HoughLinesP(edges, 1, np.pi / 180, 30,
                                          minLineLength=30, maxLineGap=100)
@@ -160,7 +130,7 @@ class FiberCamera(QWidget):
         
         print(f"Average width of wire: {average_diameter} pixels")
 
-        self.diameter_coefficient = 1.2/average_diameter #new check
+        self.diameter_coefficient = np.float32(1.2/average_diameter) #new check
         print(f"Diameter_coeff: {self.diameter_coefficient} ")
 
         Database.update_calibration_data("diameter_coefficient", 
@@ -168,30 +138,12 @@ class FiberCamera(QWidget):
     #new check
     def camera_feedback(self, current_time: float) -> None:
         try:
-            success, frame = self.capture.read()
-            if not success:
-                return
-                
-            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            height, _, _ = frame.shape
-            frame = frame[height//4:3*height//4, :]
-            
-            edges, binary_frame = self.get_edges(frame)
-            detected_lines = cv2.HoughLinesP(edges, 1, np.pi / 180, 30,
-                                         minLineLength=30, maxLineGap=100)
-            
-            # Si no hay líneas detectadas, graficar cero
-            current_diameter = self.get_fiber_diameter(detected_lines)
+            # The camera worker owns the capture, use its latest measurement
+            current_diameter = self.fiber_diameter
             
             # Actualizar gráfico siempre, incluso con valor cero
-            self.gui.diameter_plot.update_plot(current_time,current_diameter, self.target_diameter.value())
-            
-            Database.camera_timestamps.append(current_time)
-            Database.diameter_readings.append(current_diameter)
-            Database.diameter_setpoint.append(self.target_diameter.value())
-            Database.diameter_delta_time.append(current_time - self.previous_time)
-            self.previous_time = current_time
-            
+            # The worker already logs every measurement to the Database
+            self.gui.diameter_plot.update_plot(current_time,current_diameter, self.settings["target_diameter"])
         except Exception as e:
             print(f"Error en camera feedback: {e}")
     
@@ -200,3 +152,77 @@ class FiberCamera(QWidget):
         """Close the camera when the window is closed"""
         self.cap.release()
         event.accept()
+
+
+class CameraWorker(QObject):
+    """Capture and process camera frames outside of the GUI thread"""
+    frame_ready = pyqtSignal()  # A new frame can be taken with take_latest
+    DISPLAY_SIZE = (480, 320)  # Size of the video labels in the GUI
+
+    def __init__(self, fiber_camera: FiberCamera) -> None:
+        super().__init__()
+        self.fiber_camera = fiber_camera
+        self.running = True
+        self.calibration_requested = False
+        # Single slot for the newest frame, older ones are dropped if the GUI
+        # has not displayed them yet
+        self._lock = threading.Lock()
+        self._latest = None
+
+    def run(self) -> None:
+        """Loop to capture and process frames from the camera"""
+        while self.running:
+            if self.calibration_requested:
+                self.calibrate()
+                continue
+            success, frame = self.fiber_camera.capture.read()
+            if not success:
+                time.sleep(0.01)
+                continue
+            # Frames are sent as BGR arrays, the GUI wraps them without copying
+            frame, binary_frame, fiber_diameter = self.fiber_camera.process_frame(frame)
+            frame, binary_frame = self.fit_to_display(frame, binary_frame)
+            with self._lock:
+                self._latest = (frame, binary_frame, fiber_diameter)
+            self.frame_ready.emit()
+
+    def fit_to_display(self, frame: np.ndarray,
+                       binary_frame: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Shrink the frames to fit DISPLAY_SIZE, keeping their aspect ratio"""
+        height, width = frame.shape[:2]
+        scale = min(self.DISPLAY_SIZE[0] / width, self.DISPLAY_SIZE[1] / height)
+        if scale >= 1:
+            # Already fits, the centred label letterboxes it. The binary frame
+            # may be a buffer reused for the next frame, so hand out a copy
+            return frame, binary_frame.copy()
+        size = (int(width * scale), int(height * scale))
+        return (cv2.resize(frame, size, interpolation=cv2.INTER_AREA),
+                cv2.resize(binary_frame, size, interpolation=cv2.INTER_AREA))
+
+    def request_calibration(self) -> None:
+        """Calibrate the camera on the capture thread before the next frame"""
+        self.calibration_requested = True
+
+    def calibrate(self) -> None:
+        """Run the camera calibration, reporting failures to the GUI"""
+        self.calibration_requested = False
+        try:
+            self.fiber_camera.calibrate()
+            self.fiber_camera.gui.show_message(
+                "Camera calibration completed.",
+                f"Diameter coefficient: {self.fiber_camera.diameter_coefficient}")
+        except Exception as e:
+            print(f"Error in camera calibration: {e}")
+            self.fiber_camera.gui.show_message(
+                "Error in camera calibration",
+                "Make sure the calibration wire is in view and try again.")
+
+    def take_latest(self) -> Optional[Tuple[np.ndarray, np.ndarray, float]]:
+        """Take the newest processed frame, None if it was already taken"""
+        with self._lock:
+            latest, self._latest = self._latest, None
+        return latest
+
+    def stop(self) -> None:
+        """Stop the capture loop"""
+        self.running = False
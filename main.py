@@ -50,7 +50,9 @@ def hardware_control(gui: UserInterface) -> None:
 
             # Camera Feedback PLOT OPEN LOOP
             if gui.camera_feedback_enabled:
-                gui.fiber_camera.camera_feedback(current_time)
+                # The camera is opened after the window is shown
+                if gui.fiber_camera is not None:
+                    gui.fiber_camera.camera_feedback(current_time)
             elif gui.device_started:
                 extruder.temperature_control_loop(current_time)
                 extruder.stepper_control_loop()
@@ -75,5 +77,5 @@ if __name__ == "__main__":
     hardware_thread.daemon = True
     hardware_thread.start()
     # Run GUI in main thread
-    ui.show()
+    ui.start_gui()
     sys.exit(app.exec_())
@@ -1,42 +1,146 @@
-import sys
+import numpy as np
+from typing import Tuple
 from PyQt5.QtWidgets import (
     QApplication, QWidget, QGridLayout, QLabel, QPushButton, QLineEdit,
-    QCheckBox, QSlider, QVBoxLayout, QHBoxLayout, QDoubleSpinBox
+    QCheckBox, QSlider, QVBoxLayout, QHBoxLayout, QDoubleSpinBox, QMessageBox
 )
-from PyQt5.QtCore import Qt, QTimer
+from PyQt5.QtCore import Qt, QThread, QTimer, pyqtSignal
+from PyQt5.QtGui import QImage, QPixmap
+import matplotlib
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
 from matplotlib.figure import Figure
 
-from database import Database
-from fiber_camera import FiberCamera
-
-class DiameterPlot(FigureCanvas):
-    """Matplotlib plot for real-time diameter data."""
-    def __init__(self, parent=None):
-        self.fig = Figure(figsize=(5, 2.2))
-        super().__init__(self.fig)
-        self.ax = self.fig.add_subplot(111)
-        self.ax.set_title("Diameter (mm)")
-        self.ax.set_xlabel("Time (s)")
-        self.ax.set_ylabel("Diameter (mm)")
-        self.line, = self.ax.plot([], [], lw=2, label="Diameter")
-        self.setpoint_line, = self.ax.plot([], [], lw=2, color='r', label='Setpoint')
-        self.ax.legend()
-        self.x_data = []
-        self.y_data = []
-        self.setpoint_data = []
-
-    def update_plot(self, x, y, setpoint):
-        self.x_data.append(x)
-        self.y_data.append(y)
-        self.setpoint_data.append(setpoint)
-        self.line.set_data(self.x_data, self.y_data)
-        self.setpoint_line.set_data(self.x_data, self.setpoint_data)
-        self.ax.relim()
-        self.ax.autoscale_view()
+from fiber_camera import FiberCamera, CameraWorker
+
+class Plot(FigureCanvas):
+    """Matplotlib plot for real-time data and its setpoint"""
+    BUFFER_SIZE = 2400  # 2 minutes of samples at the ~20 Hz control loop rate
+    RENDER_INTERVAL_MS = 100
+    WINDOW_SECONDS = 120
+    # Merge sub-pixel segments of the live lines so Agg rasterizes less
+    DRAW_RC_PARAMS = {"path.simplify_threshold": 1.0}
+
+    def __init__(self, title: str, y_label: str,
+                 y_limits: Tuple[float, float]) -> None:
+        self.figure = Figure(figsize=(5, 2.2))
+        self.axes = self.figure.add_subplot(111)
+        super().__init__(self.figure)
+        self.axes.set_title(title)
+        self.axes.set_xlabel("Time (s)")
+        self.axes.set_ylabel(y_label)
+        self.axes.set_xlim(0, self.WINDOW_SECONDS)
+        self.axes.set_ylim(*y_limits)
+        self.progress_line, = self.axes.plot([], [], lw=2, label=title,
+                                             antialiased=False, animated=True)
+        self.setpoint_line, = self.axes.plot([], [], lw=2, color='r',
+                                             label=f'Target {title}',
+                                             antialiased=False, animated=True)
+        self.readout = self.axes.text(0.98, 0.95, "", ha='right', va='top',
+                                      transform=self.axes.transAxes,
+                                      animated=True)
+        self.axes.legend(loc='upper left')
+        # Every sample is written twice, BUFFER_SIZE apart, so the latest
+        # samples are always one contiguous slice of the buffer
+        self.x_data = np.zeros(2 * self.BUFFER_SIZE, np.float32)
+        self.y_data = np.zeros(2 * self.BUFFER_SIZE, np.float32)
+        self.setpoint_data = np.zeros(2 * self.BUFFER_SIZE, np.float32)
+        self._head = 0
+        self._count = 0
+        self._new_data = False
+        self.background = None
+        self.mpl_connect('draw_event', self.on_draw)
+        self.mpl_connect('resize_event', self.on_resize)
         self.draw()
+        self._render_timer = QTimer()
+        self._render_timer.timeout.connect(self._render)
+        self._render_timer.start(self.RENDER_INTERVAL_MS)
+
+    def on_draw(self, event) -> None:
+        """Cache the static background and draw the lines on top of it"""
+        self.background = self.copy_from_bbox(self.axes.bbox)
+        self.draw_data()
+
+    def on_resize(self, event) -> None:
+        """Discard the background, it no longer matches the canvas size"""
+        self.redraw_static()
+
+    def redraw_static(self) -> None:
+        """Redraw axes, ticks and legend, the background is cached again on draw"""
+        self.background = None
+        self.draw_idle()
+
+    def draw_data(self) -> None:
+        """Draw the artists that change with every sample"""
+        # The line paths are rebuilt from the new data while drawing, which
+        # is when the simplify threshold is read
+        with matplotlib.rc_context(self.DRAW_RC_PARAMS):
+            self.axes.draw_artist(self.progress_line)
+            self.axes.draw_artist(self.setpoint_line)
+        self.axes.draw_artist(self.readout)
+
+    def get_window(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Get views of the buffered samples in chronological order"""
+        # update_plot runs on the hardware thread and only moves _head after
+        # writing a sample. Read the count before the head, and leave out the
+        # oldest slot, so the slot being rewritten is never in the window
+        count = min(self._count, self.BUFFER_SIZE - 1)
+        end = self._head + self.BUFFER_SIZE
+        start = end - count
+        return (self.x_data[start:end], self.y_data[start:end],
+                self.setpoint_data[start:end])
+
+    def update_plot(self, x: float, y: float, setpoint: float) -> None:
+        mirror = self._head + self.BUFFER_SIZE
+        self.x_data[self._head] = self.x_data[mirror] = x
+        self.y_data[self._head] = self.y_data[mirror] = y
+        self.setpoint_data[self._head] = self.setpoint_data[mirror] = setpoint
+        self._head = (self._head + 1) % self.BUFFER_SIZE
+        self._count = min(self._count + 1, self.BUFFER_SIZE)
+        self._new_data = True
+
+    def _render(self) -> None:
+        """Draw the buffered samples, called by the render timer"""
+        if not self._new_data:
+            return
+        self._new_data = False
+        x_data, y_data, setpoint_data = self.get_window()
+        self.readout.set_text(f"{self.axes.get_title()}: {y_data[-1]:.2f}")
+        self.progress_line.set_data(x_data, y_data)
+        self.setpoint_line.set_data(x_data, setpoint_data)
+        _, x_max = self.axes.get_xlim()
+        if x_data[-1] > x_max:
+            # Page the time axis forward, this invalidates the background
+            x_max = x_data[-1] + self.WINDOW_SECONDS / 4
+            self.axes.set_xlim(x_max - self.WINDOW_SECONDS, x_max)
+            self.redraw_static()
+            return
+        if self.background is None:
+            return  # Waiting for the pending full draw
+        self.restore_region(self.background)
+        self.draw_data()
+        self.blit(self.axes.bbox)
 
 class UserInterface(QWidget):
+    message_requested = pyqtSignal(str, str)
+    # 标签通过 "class" 属性选择样式
+    STYLE_SHEET = 'QLabel[class="video"] { background-color: #222; color: white; }'
+    # (名称, 说明)
+    FILTER_CONTROLS = [
+        ("Erode", "腐蚀操作，去除细小噪点，使主线条更突出"),
+        ("Dilate", "膨胀操作，增强主线条，连接断裂部分"),
+        ("Gaussian Blur", "高斯模糊，平滑图像，减少噪声影响"),
+        ("Binary", "二值化，将图像转为黑白，突出目标区域"),
+    ]
+    # (名称, 最小值, 最大值, 步长, 默认值, 说明)
+    THRESHOLD_CONTROLS = [
+        ("Canny低阈值 (0-150, 步长5)", 0, 150, 5, 50,
+         "调节边缘检测灵敏度，越低越敏感"),
+        ("Canny高阈值 (150-300, 步长5)", 150, 300, 5, 200,
+         "调节边缘检测强度，越高越严格"),
+        ("Hough阈值 (10-100, 步长5)", 10, 100, 5, 30,
+         "调节直线检测严格程度，越低越容易检测出线"),
+    ]
+
     def __init__(self):
         super().__init__()
         self.setWindowTitle("Fiber Diameter System")
@@ -45,6 +149,12 @@ class UserInterface(QWidget):
         self.layout = QGridLayout()
         self.setLayout(self.layout)
 
+        # 非模态消息框，show_message 可在硬件线程中调用
+        self._message_box = QMessageBox(self)
+        self._message_box.setIcon(QMessageBox.Information)
+        self._message_box.setWindowModality(Qt.NonModal)
+        self.message_requested.connect(self._show_message)
+
         # ----------- 左上角按钮和输入框区 -----------
         self.calibrate_camera_btn = QPushButton("Calibrate Camera")
         self.calibration_wire_input = QLineEdit()
@@ -58,69 +168,19 @@ class UserInterface(QWidget):
         self.layout.addLayout(top_left_row, 0, 0, 1, 2)
 
         # ----------- Diameter Plot 和视频显示 -----------
-        self.diameter_plot = DiameterPlot()
+        self.diameter_plot = Plot("Diameter", "Diameter (mm)", (0.0, 2.0))
         self.layout.addWidget(self.diameter_plot, 1, 0, 1, 2)
 
-        self.raw_image = QLabel("Original Video")
-        self.raw_image.setFixedSize(480, 320)
-        self.raw_image.setStyleSheet("background-color: #222; color: white;")
-        self.raw_image.setAlignment(Qt.AlignCenter)
-        self.layout.addWidget(self.raw_image, 2, 0)
-
-        self.processed_image = QLabel("Fully Processed Video")
-        self.processed_image.setFixedSize(480, 320)
-        self.processed_image.setStyleSheet("background-color: #222; color: white;")
-        self.processed_image.setAlignment(Qt.AlignCenter)
-        self.layout.addWidget(self.processed_image, 3, 0)
+        self.raw_image = self.add_video_label("Loading camera...", 2)
+        self.processed_image = self.add_video_label("Loading camera...", 3)
 
         # ----------- 右侧参数区（全局定义控件） -----------
         right_panel = QVBoxLayout()
-        # Erode
-        self.erode_checkbox = QCheckBox("Erode")
-        right_panel.addWidget(self.erode_checkbox)
-        right_panel.addWidget(QLabel("腐蚀操作，去除细小噪点，使主线条更突出"))
-        # Dilate
-        self.dilate_checkbox = QCheckBox("Dilate")
-        right_panel.addWidget(self.dilate_checkbox)
-        right_panel.addWidget(QLabel("膨胀操作，增强主线条，连接断裂部分"))
-        # Gaussian Blur
-        self.blur_checkbox = QCheckBox("Gaussian Blur")
-        right_panel.addWidget(self.blur_checkbox)
-        right_panel.addWidget(QLabel("高斯模糊，平滑图像，减少噪声影响"))
-        # Binary
-        self.binary_checkbox = QCheckBox("Binary")
-        right_panel.addWidget(self.binary_checkbox)
-        right_panel.addWidget(QLabel("二值化，将图像转为黑白，突出目标区域"))
-
+        (self.erode_checkbox, self.dilate_checkbox, self.blur_checkbox,
+         self.binary_checkbox) = self.add_filter_controls(right_panel)
         right_panel.addSpacing(10)
-        # Canny lower threshold
-        self.canny_lower_slider = QSlider(Qt.Horizontal)
-        self.canny_lower_slider.setRange(0, 150)
-        self.canny_lower_slider.setSingleStep(5)
-        self.canny_lower_slider.setTickInterval(5)
-        self.canny_lower_slider.setValue(50)
-        right_panel.addWidget(QLabel("Canny低阈值 (0-150, 步长5)"))
-        right_panel.addWidget(self.canny_lower_slider)
-        right_panel.addWidget(QLabel("调节边缘检测灵敏度，越低越敏感"))
-        # Canny higher threshold
-        self.canny_higher_slider = QSlider(Qt.Horizontal)
-        self.canny_higher_slider.setRange(150, 300)
-        self.canny_higher_slider.setSingleStep(5)
-        self.canny_higher_slider.setTickInterval(5)
-        self.canny_higher_slider.setValue(200)
-        right_panel.addWidget(QLabel("Canny高阈值 (150-300, 步长5)"))
-        right_panel.addWidget(self.canny_higher_slider)
-        right_panel.addWidget(QLabel("调节边缘检测强度，越高越严格"))
-        # Hough threshold
-        self.hough_threshold_slider = QSlider(Qt.Horizontal)
-        self.hough_threshold_slider.setRange(10, 100)
-        self.hough_threshold_slider.setSingleStep(5)
-        self.hough_threshold_slider.setTickInterval(5)
-        self.hough_threshold_slider.setValue(30)
-        right_panel.addWidget(QLabel("Hough阈值 (10-100, 步长5)"))
-        right_panel.addWidget(self.hough_threshold_slider)
-        right_panel.addWidget(QLabel("调节直线检测严格程度，越低越容易检测出线"))
-
+        (self.canny_lower_slider, self.canny_higher_slider,
+         self.hough_threshold_slider) = self.add_threshold_controls(right_panel)
         self.layout.addLayout(right_panel, 1, 2, 4, 1)
 
         # ----------- 目标直径输入（用于标定和目标曲线） -----------
@@ -133,15 +193,96 @@ class UserInterface(QWidget):
         self.layout.addWidget(QLabel("Target Diameter (mm)"), 4, 0)
         self.layout.addWidget(self.target_diameter, 4, 1)
 
-        # ----------- FiberCamera实例，控件引用传递 -----------
-        self.fiber_camera = FiberCamera(self.target_diameter, self)
+        # 整个程序只解析一次样式表
+        QApplication.instance().setStyleSheet(self.STYLE_SHEET)
+
         self.calibrate_camera_btn.clicked.connect(self.calibrate_camera)
         self.start_motor_btn.clicked.connect(self.start_motor_sequence)
 
-        # 定时刷新
-        self.timer = QTimer()
-        self.timer.timeout.connect(self.fiber_camera.camera_loop)
-        self.timer.start(100)
+        # 打开相机较慢，窗口显示后再在 _finish_init 中创建
+        self.fiber_camera = None
+        self.camera_thread = None
+        self.camera_worker = None
+        self.calibrate_camera_btn.setEnabled(False)
+        QTimer.singleShot(0, self._finish_init)
+
+    def _finish_init(self) -> None:
+        """Open the camera and start the capture thread"""
+        # ----------- FiberCamera实例，控件引用传递 -----------
+        self.fiber_camera = FiberCamera(self.target_diameter, self)
+        self.connect_camera_settings()
+
+        # 相机采集线程
+        self.camera_thread = QThread()
+        self.camera_worker = CameraWorker(self.fiber_camera)
+        self.camera_worker.moveToThread(self.camera_thread)
+        self.camera_thread.started.connect(self.camera_worker.run)
+        self.camera_worker.frame_ready.connect(self.on_new_frame)
+        self.camera_thread.start()
+
+        self.raw_image.setText("Original Video")
+        self.processed_image.setText("Fully Processed Video")
+        self.calibrate_camera_btn.setEnabled(True)
+
+    def connect_camera_settings(self) -> None:
+        """Mirror the processing controls into the camera settings"""
+        camera = self.fiber_camera
+        checkboxes = {
+            "erode": self.erode_checkbox,
+            "dilate": self.dilate_checkbox,
+            "blur": self.blur_checkbox,
+            "binary": self.binary_checkbox,
+        }
+        for name, checkbox in checkboxes.items():
+            camera.update_setting(name, checkbox.isChecked())
+            checkbox.toggled.connect(
+                lambda checked, name=name: camera.update_setting(name, checked))
+        values = {
+            "canny_lower": self.canny_lower_slider,
+            "canny_higher": self.canny_higher_slider,
+            "hough_threshold": self.hough_threshold_slider,
+            "target_diameter": self.target_diameter,
+        }
+        for name, widget in values.items():
+            camera.update_setting(name, widget.value())
+            widget.valueChanged.connect(
+                lambda value, name=name: camera.update_setting(name, value))
+
+    def add_video_label(self, text: str, row: int) -> QLabel:
+        """Add a label to display a video feed to the layout"""
+        label = QLabel(text)
+        label.setProperty("class", "video")
+        label.setFixedSize(*CameraWorker.DISPLAY_SIZE)
+        label.setScaledContents(False)
+        label.setAlignment(Qt.AlignCenter)
+        self.layout.addWidget(label, row, 0)
+        return label
+
+    def add_filter_controls(self, panel: QVBoxLayout) -> Tuple[QCheckBox, ...]:
+        """Add UI checkboxes to enable the image filters"""
+        checkboxes = []
+        for text, hint in self.FILTER_CONTROLS:
+            checkbox = QCheckBox(text)
+            panel.addWidget(checkbox)
+            panel.addWidget(QLabel(hint))
+            checkboxes.append(checkbox)
+        return tuple(checkboxes)
+
+    def add_threshold_controls(self, panel: QVBoxLayout) -> Tuple[QSlider, ...]:
+        """Add UI sliders to tune the edge and line detection thresholds"""
+        sliders = []
+        for text, minimum, maximum, step, value, hint in self.THRESHOLD_CONTROLS:
+            label = QLabel(text)
+            slider = QSlider(Qt.Horizontal)
+            slider.setRange(minimum, maximum)
+            slider.setSingleStep(step)
+            slider.setTickInterval(step)
+            slider.setValue(value)
+            panel.addWidget(label)
+            panel.addWidget(slider)
+            panel.addWidget(QLabel(hint))
+            sliders.append(slider)
+        return tuple(sliders)
 
     def calibrate_camera(self):
         try:
@@ -149,7 +290,8 @@ class UserInterface(QWidget):
             self.fiber_camera.calibration_wire_diameter = real_diameter_mm
         except Exception:
             self.fiber_camera.calibration_wire_diameter = None
-        self.fiber_camera.calibrate()
+        # Runs on the camera thread, reading 50 frames would freeze the GUI
+        self.camera_worker.request_calibration()
 
     def start_motor_sequence(self):
         """Start motor, extruder, fan, and heater at required settings."""
@@ -162,45 +304,46 @@ class UserInterface(QWidget):
         self.show_message("Start Motor", "Motor started at 30% PWM, fan at 100%, heater at 95°C, extruder at normal speed.")
 
     def start_gui(self) -> None:
-        timer = QTimer()
-        timer.timeout.connect(self.fiber_camera.camera_loop)
-        timer.start(200)
-        self.window.show()
-        self.app.exec_()
+        """Show the window, the camera is started once it is up"""
+        self.show()
+
+    def closeEvent(self, event) -> None:
+        """Stop the camera thread when the window is closed"""
+        if self.camera_worker is not None:
+            self.camera_worker.stop()
+            self.camera_thread.quit()
+            self.camera_thread.wait()
+            self.fiber_camera.capture.release()
+        event.accept()
+
+    def on_new_frame(self) -> None:
+        """Display the newest processed camera frame"""
+        latest = self.camera_worker.take_latest()
+        if latest is None:
+            return  # Already displayed on an earlier signal
+        frame, binary_frame, _ = latest
+        # The QImages share memory with the arrays, which stay alive
+        # until QPixmap.fromImage has copied them
+        image = QImage(frame.data, frame.shape[1], frame.shape[0],
+                       frame.strides[0], QImage.Format_BGR888)
+        self.raw_image.setPixmap(QPixmap.fromImage(image))
+        image = QImage(binary_frame.data, binary_frame.shape[1],
+                       binary_frame.shape[0], binary_frame.strides[0],
+                       QImage.Format_Grayscale8)
+        self.processed_image.setPixmap(QPixmap.fromImage(image))
 
     def show_message(self, title: str, message: str) -> None:
-        QMessageBox.information(self.app.activeWindow(), title, message)
+        """Show a message box without blocking, safe to call from any thread"""
+        self.message_requested.emit(title, message)
+
+    def _show_message(self, title: str, message: str) -> None:
+        """Update and show the message box on the GUI thread"""
+        self._message_box.setWindowTitle(title)
+        self._message_box.setText(message)
+        self._message_box.show()
 
     def update_temperature_slider_label(self, value) -> None:
         self.target_temperature_label.setText(f"Temperature: {value} C")
 
     def update_fan_slider_label(self, value) -> None:
         self.fan_duty_cycle_label.setText(f"Fan Duty Cycle: {value} %")
-
-    class Plot(FigureCanvas):
-        """Base class for plots"""
-        def __init__(self, title: str, y_label: str) -> None:
-            self.figure = Figure()
-            self.axes = self.figure.add_subplot(111)
-            super(UserInterface.Plot, self).__init__(self.figure)
-            self.axes.set_title(title)
-            self.axes.set_xlabel("Time (s)")
-            self.axes.set_ylabel(y_label)
-            self.progress_line, = self.axes.plot([], [], lw=2, label=title)
-            self.setpoint_line, = self.axes.plot([], [], lw=2, color='r', label=f'Target {title}')
-            self.axes.legend()
-            self.x_data = []
-            self.y_data = []
-            self.setpoint_data = []
-
-        def update_plot(self, x: float, y: float, setpoint: float) -> None:
-            self.x_data.append(x)
-            self.y_data.append(y)
-            self.setpoint_data.append(setpoint)
-            self.progress_line.set_label(f"{self.axes.get_title()}: {y:.2f}")
-            self.axes.legend()
-            self.progress_line.set_data(self.x_data, self.y_data)
-            self.setpoint_line.set_data(self.x_data, self.setpoint_data)
-            self.axes.relim()
-            self.axes.autoscale_view()
-            self.draw()